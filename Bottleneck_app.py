@@ -1,3 +1,8 @@
+import glob
+import hashlib
+import os
+import tempfile
+import numpy as np
 import pandas as pd
 import streamlit as st
 from io import BytesIO
@@ -13,25 +18,208 @@ st.caption("Operator Balancing • Kaizen Simulation • Bottleneck Analysis •
 st.sidebar.header("⚙️ Control Panel")
 if st.sidebar.button("🔄 Refresh Data"):
     st.cache_data.clear()
+    st.cache_resource.clear()
     st.success("Data refreshed!")
 
 # ================= LOAD EXCEL DATA =================
-@st.cache_data
-def load_data():
-    xls = pd.ExcelFile("Route File Lean.xlsx")
-    cograde = pd.read_excel(xls, "cograde")
-    rodetail = pd.read_excel(xls, "rodetail")
-    apnrn = pd.read_excel(xls, "apnrn")
-    immaster = pd.read_excel(xls, "immaster")
-    for df in [cograde, rodetail, apnrn, immaster]:
+DATA_FILE = "Route File Lean.xlsx"
+SHEETS = ["cograde", "rodetail", "apnrn", "immaster"]
+CACHE_DIR = ".cache"
+CACHE_KEEP = 3  # workbook versions kept on disk
+
+def read_workbook():
+    # calamine parses all sheets in one pass; fall back to openpyxl if not installed.
+    # Arrow-backed dtypes keep strings in contiguous buffers instead of object columns
+    try:
+        sheets = pd.read_excel(DATA_FILE, sheet_name=SHEETS, engine="calamine", dtype_backend="pyarrow")
+    except ImportError:
+        sheets = pd.read_excel(DATA_FILE, sheet_name=SHEETS, engine="openpyxl", dtype_backend="pyarrow")
+    for df in sheets.values():
         df.columns = df.columns.str.strip().str.lower()
-    return cograde, rodetail, apnrn, immaster
-
-cograde, rodetail, apnrn, immaster = load_data()
+    return sheets
+
+def prune_cache():
+    files = sorted(glob.glob(os.path.join(CACHE_DIR, "*.parquet")), key=os.path.getmtime, reverse=True)
+    for path in files[CACHE_KEEP * len(SHEETS):]:
+        os.remove(path)
+
+def read_cached_sheets(paths):
+    if not all(os.path.exists(path) for path in paths.values()):
+        return None
+    try:
+        sheets = {name: pd.read_parquet(path, dtype_backend="pyarrow") for name, path in paths.items()}
+    except (OSError, ValueError):
+        return None  # unreadable or truncated file: treat as a cache miss
+    try:
+        for path in paths.values():
+            os.utime(path)
+    except OSError:
+        pass
+    return sheets
+
+def write_cached_sheets(sheets, paths):
+    # Best effort: a read-only directory, full disk or unstorable column just skips the cache.
+    # Each sheet goes to a temp file first so a failed write never leaves a partial .parquet
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        for name, df in sheets.items():
+            fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+            os.close(fd)
+            try:
+                df.to_parquet(tmp, compression="zstd")
+                os.replace(tmp, paths[name])
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        prune_cache()
+    except (OSError, ValueError, TypeError):
+        pass
+
+def load_sheets():
+    # Parsed sheets are kept as Parquet, keyed by the workbook's hash + mtime
+    with open(DATA_FILE, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    key = f"{digest}_{int(os.path.getmtime(DATA_FILE))}"
+    paths = {name: os.path.join(CACHE_DIR, f"{key}_{name}.parquet") for name in SHEETS}
+
+    sheets = read_cached_sheets(paths)
+    if sheets is None:
+        sheets = read_workbook()
+        write_cached_sheets(sheets, paths)
+    return sheets
+
+# Shared by reference across sessions: callers must not mutate the returned frames in place
+@st.cache_resource(show_spinner=False)
+def load_data():
+    sheets = load_sheets()
+    cograde, rodetail, apnrn, immaster = (sheets[name] for name in SHEETS)
+
+    rodetail["laborgrade"] = rodetail["laborgrade"].astype("string[pyarrow]").str.strip().str.lower()
+    cograde["grade"] = cograde["grade"].astype("string[pyarrow]").str.strip().str.lower()
+    # Few distinct routes across many operation rows
+    rodetail["routeno"] = rodetail["routeno"].astype("category")
+
+    # Hash indexes so per-rerun lookups are .loc[] hits instead of full scans
+    apnrn_by_part = apnrn.set_index("partno", drop=False).sort_index()
+    rodetail_by_route = rodetail.set_index("routeno", drop=False).sort_index()
+    rate_map = dict(zip(cograde["grade"], cograde["hourrate"].astype(float)))
+    item_list = tuple(sorted(immaster["item"].dropna().unique().tolist()))
+    return item_list, apnrn_by_part, rodetail_by_route, rate_map
+
+item_list, apnrn_by_part, rodetail_by_route, rate_map = load_data()
+
+# ================= ROUTE LOOKUP =================
+@st.cache_data(show_spinner=False, max_entries=256)
+def get_route_ops(item_input, _apnrn_by_part, _rodetail_by_route, _rate_map):
+    # Keyed by item only; the underscored lookup tables are not hashed by Streamlit
+    if item_input not in _apnrn_by_part.index:
+        return None
+    route_no = _apnrn_by_part.loc[[item_input]].iloc[0]["routeno"]
+    if route_no not in _rodetail_by_route.index:
+        return None
+
+    # List-based .loc already returns a new frame, so no defensive copy is needed
+    route_ops = _rodetail_by_route.loc[[route_no]]
+    # Back to NumPy for the numeric column the calculations run on (NaN-on-zero semantics)
+    route_ops["cycletime"] = pd.to_numeric(route_ops["cycletime"], errors="coerce").fillna(0).to_numpy()
+    route_ops = route_ops.sort_values("opno", ignore_index=True)
+    route_ops["station"] = np.arange(1, len(route_ops) + 1) * 10
+
+    # ===== Hour rate per operation =====
+    route_ops["hourrate"] = route_ops["laborgrade"].map(_rate_map).fillna(0.0)
+    # Don't carry every route's category into the cached entry
+    route_ops["routeno"] = route_ops["routeno"].cat.remove_unused_categories()
+    return route_ops
+
+# ================= REPORT =================
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_report_bytes(report_df):
+    # Keyed by the frame's content, so reruns with unchanged results skip the xlsx build
+    output = BytesIO()
+    # constant_memory is left off: pandas writes cells column by column, which it would drop
+    with pd.ExcelWriter(
+        output,
+        engine="xlsxwriter",
+        engine_kwargs={"options": {"strings_to_urls": False}}
+    ) as writer:
+        report_df.to_excel(writer, index=False)
+    return output.getvalue()
+
+# ================= IMPROVEMENT KERNEL =================
+def improvements_loop(original, operators, saving_sec, improvement_pct, rate, order_qty):
+    # Single fused pass, compiled with numba when it is available
+    n = len(original)
+    new_time = np.empty(n)
+    red = np.empty(n)
+    save_unit = np.empty(n)
+    save_order = np.empty(n)
+    max_time = -np.inf
+    for i in range(n):
+        nt = original[i] / (operators[i] + 1) - saving_sec[i]
+        if nt < 0.0:
+            nt = 0.0
+        if improvement_pct[i] > 0:
+            nt = nt * (1 - improvement_pct[i] / 100)
+        if nt < 0.0:
+            nt = 0.0
+        new_time[i] = nt
+        red[i] = original[i] - nt
+        save_unit[i] = (red[i] / 3600) * rate[i]
+        save_order[i] = save_unit[i] * order_qty
+        if nt > max_time:
+            max_time = nt
+    return new_time, red, save_unit, save_order, new_time == max_time
+
+def improvements_numpy(original, operators, saving_sec, improvement_pct, rate, order_qty):
+    new_time = np.maximum(original / (operators + 1) - saving_sec, 0)
+    new_time = new_time * np.where(improvement_pct > 0, 1 - improvement_pct / 100, 1.0)
+    new_time = np.maximum(new_time, 0)
+    red = original - new_time
+    save_unit = (red / 3600) * rate
+    return new_time, red, save_unit, save_unit * order_qty, new_time == np.nanmax(new_time)
+
+@st.cache_resource(show_spinner=False)
+def get_improvement_kernel():
+    try:
+        import numba
+    except ImportError:
+        return improvements_numpy
+    kernel = numba.njit(cache=True)(improvements_loop)
+    # Force compilation (or loading from the on-disk cache) inside this cached call
+    dummy = np.zeros(1)
+    kernel(dummy, dummy, dummy, dummy, dummy, 1.0)
+    return kernel
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def compute_improvements(original, operators, saving_sec, improvement_pct, rate, order_qty):
+    # Streamlit hashes the input arrays, so editor reruns that don't change any value are cache hits
+    improve = get_improvement_kernel()
+    return improve(original, operators, saving_sec, improvement_pct, rate, order_qty)
+
+# Warm the kernel on page load, before any item is selected
+get_improvement_kernel()
+
+# ================= TABLE DISPLAY =================
+TABLE_ROW_LIMIT = 50
+TABLE_TOP_N = 20
+SUMMED_COLS = ["cycletime", "improved_cycle", "saving_sec", "savings_$ per unit", "savings_$ order"]
+
+def summarize_long_route(detailed_df):
+    # Long routes show only the slowest operations (and the new bottleneck) plus one
+    # aggregate row for the rest; the export still gets the full frame
+    if len(detailed_df) <= TABLE_ROW_LIMIT:
+        return detailed_df
+    slowest = detailed_df.nlargest(TABLE_TOP_N, "cycletime")
+    top = detailed_df.loc[detailed_df.index.isin(slowest.index) | detailed_df["new_bottleneck"]]
+    rest = detailed_df.drop(top.index)
+    summary = {col: rest[col].sum() for col in SUMMED_COLS}
+    summary["descrip"] = f"(+{len(rest)} more)"
+    summary["new_bottleneck"] = False  # flagged rows are always kept in top
+    shown = pd.concat([top, pd.DataFrame([summary])], ignore_index=True)
+    return shown.astype({"opno": detailed_df["opno"].dtype, "station": "Int64"})[detailed_df.columns]
 
 # ================= SIDEBAR INPUTS =================
-item_list = sorted(immaster["item"].dropna().unique())
-item_input = st.sidebar.selectbox("📦 Select Item", ["--Select--"] + item_list)
+item_input = st.sidebar.selectbox("📦 Select Item", ("--Select--",) + item_list)
 customer_demand = st.sidebar.number_input("📈 Demand per Shift", value=400)
 order_qty = st.sidebar.number_input("📦 Order Quantity", min_value=1, value=500)
 shift_hours = st.sidebar.number_input(
@@ -43,29 +231,11 @@ shift_sec = shift_hours * 3600
 if item_input != "--Select--":
 
     # Fetch item route
-    route_row = apnrn[apnrn["partno"] == item_input]
-    if route_row.empty:
+    route_ops = get_route_ops(item_input, apnrn_by_part, rodetail_by_route, rate_map)
+    if route_ops is None:
         st.error("No route found for this item.")
         st.stop()
 
-    route_no = route_row.iloc[0]["routeno"]
-    route_ops = rodetail[rodetail["routeno"] == route_no].copy()
-    route_ops["cycletime"] = pd.to_numeric(route_ops["cycletime"], errors="coerce").fillna(0)
-    route_ops = route_ops.sort_values("opno").reset_index(drop=True)
-    route_ops["station"] = [(i + 1) * 10 for i in range(len(route_ops))]
-
-    # ===== Merge hour rate per operation =====
-    route_ops["laborgrade"] = route_ops["laborgrade"].astype(str).str.strip().str.lower()
-    cograde["grade"] = cograde["grade"].astype(str).str.strip().str.lower()
-    route_ops = route_ops.merge(
-        cograde[["grade", "hourrate"]],
-        left_on="laborgrade",
-        right_on="grade",
-        how="left"
-    )
-    route_ops["hourrate"] = route_ops["hourrate"].fillna(0)
-    route_ops.drop(columns=["grade"], inplace=True)
-
     # Current metrics
     bottleneck_time = route_ops["cycletime"].max()
     route_ops["bottleneck"] = route_ops["cycletime"] == bottleneck_time
@@ -91,42 +261,25 @@ if item_input != "--Select--":
         input_df["Improvement %"] = 0.0
 
         edited_df = st.data_editor(input_df, use_container_width=True, height=400)
-        edited_df = edited_df.copy()
 
     # ================= CALCULATIONS =================
-    improved_cycle = []
-    reduction = []
-    savings_per_unit = []
-    savings_order = []
-
-    for i, row in edited_df.iterrows():
-        original = row["cycletime"]
-        operators = row["Extra Operators"]
-        saving_sec = row["Time Saving (sec)"]
-        improvement_pct = row["Improvement %"]
-        rate = row["hourrate"]
-
-        new_time = original / (operators + 1)
-        new_time = max(new_time - saving_sec, 0)
-        if improvement_pct > 0:
-            new_time = new_time * (1 - improvement_pct / 100)
-        new_time = max(new_time, 0)
-        improved_cycle.append(new_time)
-
-        red = original - new_time
-        reduction.append(red)
-
-        save_unit = (red / 3600) * rate
-        savings_per_unit.append(save_unit)
-        savings_order.append(save_unit * order_qty)
-
-    improved_cycle = pd.Series(improved_cycle)
-    reduction = pd.Series(reduction)
-    savings_per_unit = pd.Series(savings_per_unit)
-    savings_order = pd.Series(savings_order)
+    original = edited_df["cycletime"].to_numpy(dtype=float)
+    operators = edited_df["Extra Operators"].to_numpy(dtype=float)
+    saving_sec = edited_df["Time Saving (sec)"].to_numpy(dtype=float)
+    improvement_pct = edited_df["Improvement %"].to_numpy(dtype=float)
+    rate = edited_df["hourrate"].to_numpy(dtype=float)
+
+    new_time, red, save_unit, save_order, is_bottleneck = compute_improvements(
+        original, operators, saving_sec, improvement_pct, rate, float(order_qty)
+    )
+
+    improved_cycle = pd.Series(new_time)
+    reduction = pd.Series(red)
+    savings_per_unit = pd.Series(save_unit)
+    savings_order = pd.Series(save_order)
 
     new_bottleneck_time = improved_cycle.max()
-    new_bottleneck_flag = improved_cycle == new_bottleneck_time
+    new_bottleneck_flag = pd.Series(is_bottleneck)
     new_throughput = 3600 / new_bottleneck_time if new_bottleneck_time else 0
 
     # ================= RESULTS =================
@@ -150,7 +303,7 @@ if item_input != "--Select--":
             st.success("✅ Meets customer demand")
 
         total_time_saved = reduction.sum()
-        total_savings_order = sum(savings_order)
+        total_savings_order = savings_order.sum()
         st.info(f"Total Time Saved: {total_time_saved:.1f} sec")
         st.info(f"Estimated Total Savings for Order: ${total_savings_order:,.2f}")
 
@@ -160,38 +313,44 @@ if item_input != "--Select--":
     st.subheader("📊 Yamazumi Chart")
     fig = go.Figure()
 
-    for i, row in edited_df.iterrows():
-        work_color = "red" if improved_cycle.iloc[i] > takt_time else ("orange" if new_bottleneck_flag.iloc[i] else "steelblue")
-        save_color = "green" if reduction.iloc[i] > 0 else "rgba(0,0,0,0)"
-
-        hover_text = (
-            f"Op: {row['opno']}<br>"
-            f"Description: {row['descrip']}<br>"
-            f"Original Cycle: {row['cycletime']:.1f} sec<br>"
-            f"Hour Rate: ${row['hourrate']:.2f}/hr<br>"
-            f"Improved Cycle: {improved_cycle.iloc[i]:.1f} sec<br>"
-            f"Time Saved: {reduction.iloc[i]:.1f} sec<br>"
-            f"Improvement %: {edited_df['Improvement %'].iloc[i]:.1f}%<br>"
-            f"Savings $ per Unit: ${savings_per_unit.iloc[i]:.2f}<br>"
-            f"Savings $ Order: ${savings_order.iloc[i]:.2f}"
+    over_takt = improved_cycle.to_numpy() > takt_time
+    work_colors = np.where(over_takt, "red", np.where(new_bottleneck_flag.to_numpy(), "orange", "steelblue"))
+    save_colors = np.where(reduction.to_numpy() > 0, "green", "rgba(0,0,0,0)")
+
+    hover_texts = [
+        f"Op: {row.opno}<br>"
+        f"Description: {row.descrip}<br>"
+        f"Original Cycle: {row.cycletime:.1f} sec<br>"
+        f"Hour Rate: ${row.hourrate:.2f}/hr<br>"
+        f"Improved Cycle: {new:.1f} sec<br>"
+        f"Time Saved: {red:.1f} sec<br>"
+        f"Improvement %: {pct:.1f}%<br>"
+        f"Savings $ per Unit: ${unit:.2f}<br>"
+        f"Savings $ Order: ${order:.2f}"
+        for row, new, red, pct, unit, order in zip(
+            edited_df.itertuples(), improved_cycle, reduction,
+            edited_df["Improvement %"], savings_per_unit, savings_order
         )
+    ]
 
-        fig.add_bar(
-            x=[row["station"]],
-            y=[improved_cycle.iloc[i]],
-            name="Work Content",
-            marker_color=work_color,
-            showlegend=False,
-            hovertemplate=hover_text
-        )
-        fig.add_bar(
-            x=[row["station"]],
-            y=[reduction.iloc[i]],
-            name="Time Saved",
-            marker_color=save_color,
-            showlegend=False,
-            hovertemplate=hover_text
-        )
+    fig.add_bar(
+        x=edited_df["station"],
+        y=improved_cycle,
+        name="Work Content",
+        marker_color=work_colors,
+        showlegend=False,
+        hovertext=hover_texts,
+        hoverinfo="text"
+    )
+    fig.add_bar(
+        x=edited_df["station"],
+        y=reduction,
+        name="Time Saved",
+        marker_color=save_colors,
+        showlegend=False,
+        hovertext=hover_texts,
+        hoverinfo="text"
+    )
 
     takt_line_color = "red" if new_bottleneck_time > takt_time else "black"
     fig.add_hline(
@@ -204,6 +363,7 @@ if item_input != "--Select--":
 
     fig.update_layout(
         barmode='stack',
+        uirevision="yamazumi",
         height=500,
         xaxis_title="Station",
         yaxis_title="Cycle Time (sec)"
@@ -214,15 +374,19 @@ if item_input != "--Select--":
 
     # ================= LEAN & SIX SIGMA RECOMMENDATIONS =================
     st.subheader("📌 Lean & Six Sigma Recommendations")
-    recommendations = []
+    ct = route_ops["cycletime"].to_numpy(dtype=float)
+    ct_variation = ct.std(ddof=1) / ct.mean() if len(ct) > 1 else np.nan
+    setup_col = "setup_time" if "setup_time" in route_ops else None
+    setup_max = np.nanmax(route_ops[setup_col].to_numpy(dtype=float)) if setup_col else 0.0
 
+    recommendations = []
     if new_bottleneck_time > takt_time:
         recommendations.append("🔴 Bottleneck exceeds Takt → Line Balancing + Yamazumi.")
     if total_time_saved > 0:
         recommendations.append("📈 Improvement validated → Update Standard Work.")
-    if route_ops["cycletime"].std() / route_ops["cycletime"].mean() > 0.2:  # example high variation threshold
+    if ct_variation > 0.2:  # example high variation threshold
         recommendations.append("📊 High variation → Run Six Sigma DMAIC.")
-    if route_ops.get("setup_time") is not None and route_ops["setup_time"].max() > 300:  # high setup example
+    if setup_max > 300:  # high setup example
         recommendations.append("⚙️ High setup → Apply SMED.")
     if new_throughput < customer_demand:
         recommendations.append("📉 Low throughput → Kaizen waste elimination.")
@@ -235,28 +399,27 @@ if item_input != "--Select--":
 
     # ================= DETAILED TABLE =================
     st.subheader("📋 Detailed Data")
-    route_ops["improved_cycle"] = improved_cycle
-    route_ops["saving_sec"] = reduction
-    route_ops["improvement_%"] = edited_df["Improvement %"]
-    route_ops["new_bottleneck"] = new_bottleneck_flag
-    route_ops["savings_$ per unit"] = savings_per_unit
-    route_ops["savings_$ order"] = savings_order
-
-    detailed_cols = [
-        "opno", "descrip", "cycletime", "hourrate", "station",
-        "improved_cycle", "saving_sec", "improvement_%",
-        "new_bottleneck", "savings_$ per unit", "savings_$ order"
-    ]
-    st.dataframe(route_ops[detailed_cols], use_container_width=True)
+    # Built once from the result arrays; shared by the table and the export
+    detailed_df = pd.DataFrame({
+        "opno": route_ops["opno"],
+        "descrip": route_ops["descrip"],
+        "cycletime": route_ops["cycletime"],
+        "hourrate": route_ops["hourrate"],
+        "station": route_ops["station"],
+        "improved_cycle": improved_cycle,
+        "saving_sec": reduction,
+        "improvement_%": edited_df["Improvement %"],
+        "new_bottleneck": new_bottleneck_flag,
+        "savings_$ per unit": savings_per_unit,
+        "savings_$ order": savings_order
+    })
+    st.dataframe(summarize_long_route(detailed_df), use_container_width=True)
 
     # ================= EXPORT =================
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        route_ops[detailed_cols].to_excel(writer, index=False)
     now = datetime.now().strftime("%Y%m%d_%H%M")
     st.download_button(
         "⬇ Download Report",
-        data=output.getvalue(),
+        data=build_report_bytes(detailed_df),
         file_name=f"{item_input}_Lean_Report_{now}.xlsx"
     )
 